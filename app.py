@@ -1,18 +1,246 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 import google.generativeai as genai
 import os
 import json
 import time
+import zlib
+import re
+import random
+import threading
+import hashlib
+import sys
+import io
+import cProfile
+import pstats
+import marshal
+import itertools
+import math
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+# orjson is optional - fall back to the standard library encoder without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# On-disk snapshot files (binary format, plus the legacy JSON file we still read)
+MEALS_SNAPSHOT_FILE = 'meals_data.bin'
+LEGACY_MEALS_SNAPSHOT_FILE = 'meals_data.json'
+SNAPSHOT_MAGIC = b'EMS1'
+
+# Meals generation mode: 'combined' (one prompt for all meals) or 'parallel' (one request per meal type)
+MEALS_GENERATION_MODE = os.environ.get('MEALS_GENERATION_MODE', 'combined')
+# Whether clients may pick the generation mode per request ("mode" in the /generate_all_menus body)
+ALLOW_CLIENT_GENERATION_MODE = os.environ.get('ALLOW_CLIENT_GENERATION_MODE', '0') == '1'
+# Seconds to wait before issuing a hedged duplicate request in parallel mode (0 disables hedging)
+HEDGE_DELAY_SECONDS = float(os.environ.get('HEDGE_DELAY_SECONDS', '0'))
+# How many times a single failed meal type is retried in parallel mode
+PARALLEL_MEAL_RETRIES = 1
+
+# Time budget for a request when the client sends no X-Request-Deadline-Ms header
+DEFAULT_REQUEST_DEADLINE_SECONDS = float(os.environ.get('REQUEST_DEADLINE_SECONDS', '30'))
+# Starting estimate of a Gemini call's latency, refined as calls complete
+GEMINI_LATENCY_ESTIMATE_SECONDS = 5.0
+# After this many Gemini failures in a row, skip it for GEMINI_FAILURE_BACKOFF_SECONDS and
+# answer from the cheaper tiers
+GEMINI_FAILURE_THRESHOLD = int(os.environ.get('GEMINI_FAILURE_THRESHOLD', '5'))
+GEMINI_FAILURE_BACKOFF_SECONDS = float(os.environ.get('GEMINI_FAILURE_BACKOFF_SECONDS', '60'))
+# Cached menus are fresh for an hour and still usable as a degraded answer for a day
+FRESH_MEALS_MAX_AGE = 3600
+STALE_MEALS_MAX_AGE = 86400
+# Degradation tiers for menus, from best to worst
+MENU_SOURCE_TIERS = ['fresh_cache', 'ai', 'stale_cache', 'catalog', 'fallback']
+
+# Profiling: per-request cProfile dumps, slow-request stack samples and the admin endpoints
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+SLOW_REQUEST_THRESHOLD_SECONDS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_SECONDS', '5'))
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.01
+# Accepted values of the profile query param / X-Profile header, mapped to the dump format
+PROFILE_FORMATS = {'1': 'text', 'text': 'text', 'raw': 'raw', 'collapsed': 'collapsed'}
+RECENT_REQUESTS_KEPT = 200
+
+# Nutrients tracked per consumption session
+NUTRIENT_KEYS = ['calories', 'protein', 'carbs', 'fiber']
+# Width of each nutrition gap band; suggestions are only regenerated when a gap changes band
+SUGGESTION_BANDS = {
+    'calorie_diff': 100,
+    'protein_diff': 10,
+    'carb_diff': 20,
+    'fiber_diff': 5
+}
+MAX_CACHED_SUGGESTIONS = 1000
+# Consumption sessions idle for longer than this are discarded
+CONSUMPTION_SESSION_TTL = 86400
+
+# Gemini model used for every request
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+# Record/replay of Gemini traffic: 'off', 'record' or 'replay'
+GEMINI_REPLAY_MODE = os.environ.get('GEMINI_REPLAY_MODE', 'off')
+GEMINI_REPLAY_STORE = os.environ.get('GEMINI_REPLAY_STORE', 'gemini_recordings.jsonl')
+# Replay latency multiplier: 1 keeps the recorded timing, 0 replays instantly
+GEMINI_REPLAY_SPEED = float(os.environ.get('GEMINI_REPLAY_SPEED', '1'))
+
+# Dish name normalization: filler words to drop and Telugu/English spellings to unify
+DISH_STOPWORDS = {'with', 'and', 'the', 'of', 'in', 'a', 'style', 'andhra'}
+DISH_SYNONYMS = {
+    'allam': 'ginger',
+    'pappu': 'dal',
+    'dhal': 'dal',
+    'daal': 'dal',
+    'perugu': 'curd',
+    'annam': 'rice',
+    'pachadi': 'chutney',
+    'kura': 'curry',
+    'koora': 'curry',
+    'charu': 'rasam',
+    'chaaru': 'rasam'
+}
+# Dishes are only the same dish when their whole names have at least this trigram similarity
+# and every word of one name matches a word of the other with DISH_TOKEN_SIMILARITY_THRESHOLD,
+# so "Bendakaya Fry" and "Dondakaya Fry" stay separate while spelling variants still merge
+DISH_SIMILARITY_THRESHOLD = 0.8
+DISH_TOKEN_SIMILARITY_THRESHOLD = 0.7
+
+def dumps_json(obj):
+    """Serialize an object to compact UTF-8 JSON bytes using the fastest available encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def loads_json(data):
+    """Parse JSON from bytes or str using the fastest available decoder"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that uses orjson when it is installed"""
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = 0
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Global cache for meals data
 meals_cache = {
     'data': None,
     'timestamp': None,
-    'total_calories': None
+    'total_calories': None,
+    'encoded': None
 }
 
+# Running nutrition totals per browser session, and suggestions keyed by gap bands
+consumption_sessions = {}
+suggestions_cache = {}
+consumption_lock = threading.Lock()
+
+def start_consumption_session(session_id, seq=0):
+    """Create an empty consumption session, discarding idle ones. Call with consumption_lock held."""
+    now = time.time()
+    for stale_id in [sid for sid, session in consumption_sessions.items() if now - session['updated'] > CONSUMPTION_SESSION_TTL]:
+        del consumption_sessions[stale_id]
+    session = {
+        'requirements': None,
+        'totals': dict.fromkeys(NUTRIENT_KEYS, 0.0),
+        'seq': seq,
+        'updated': now
+    }
+    consumption_sessions[session_id] = session
+    return session
+
+def apply_consumption_delta(session, op, item):
+    """Add or remove one menu item's nutrition from a session's running totals"""
+    if op not in ('add', 'remove'):
+        raise ValueError(f"Unknown consumption op: {op}")
+    sign = 1 if op == 'add' else -1
+    for key in NUTRIENT_KEYS:
+        session['totals'][key] += sign * float(item.get(key, 0))
+
+def resync_consumption_totals(session, client_totals):
+    """Replace a session's running totals with the client's after updates were lost or reordered"""
+    print(f"Resyncing consumption totals at update {session['seq']}")
+    session['totals'] = {key: float(client_totals[key]) for key in NUTRIENT_KEYS}
+
+def consumption_diffs(session):
+    """Remaining nutrition (requirement minus consumed) for a session"""
+    requirements = session['requirements']
+    totals = session['totals']
+    return {
+        'calorie_diff': round(requirements['calories'] - totals['calories']),
+        'protein_diff': round(requirements['protein'] - totals['protein']),
+        'carb_diff': round(requirements['carbs'] - totals['carbs']),
+        'fiber_diff': round(requirements['fiber'] - totals['fiber'])
+    }
+
+def suggestion_band_key(diffs):
+    """Bucket nutrition gaps into bands so nearby gaps share the same suggestions"""
+    return tuple(int(float(diffs[key]) // width) for key, width in SUGGESTION_BANDS.items())
+
+def set_meals_cache(data, timestamp, total_calories):
+    """Store meals data in the cache together with its pre-serialized JSON bytes"""
+    global meals_cache
+    meals_cache = {
+        'data': data,
+        'timestamp': timestamp,
+        'total_calories': total_calories,
+        'encoded': dumps_json(data) if data is not None else None
+    }
+
+def get_encoded_menus(cache):
+    """Return a meals cache entry's menus as JSON bytes, encoding them once if needed.
+    
+    Takes the cache dict itself rather than reading the global, so the data and its
+    encoding always come from the same entry even if set_meals_cache runs meanwhile.
+    """
+    if cache.get('encoded') is None and cache['data'] is not None:
+        cache['encoded'] = dumps_json(cache['data'])
+    return cache.get('encoded')
+
+def write_meals_snapshot(path=MEALS_SNAPSHOT_FILE):
+    """Write the meals cache to disk as zlib-compressed compact JSON"""
+    cache = meals_cache
+    payload = dumps_json({
+        'data': cache['data'],
+        'timestamp': cache['timestamp'],
+        'total_calories': cache['total_calories']
+    })
+    # Write to a temp file first so a partial write never replaces a good snapshot
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + zlib.compress(payload, 6))
+    os.replace(temp_path, path)
+
+def read_meals_snapshot():
+    """Read the newest meals snapshot from disk, or return None if there is none"""
+    if os.path.exists(MEALS_SNAPSHOT_FILE):
+        with open(MEALS_SNAPSHOT_FILE, 'rb') as f:
+            raw = f.read()
+        if not raw.startswith(SNAPSHOT_MAGIC):
+            raise ValueError(f"{MEALS_SNAPSHOT_FILE} is not a meals snapshot")
+        return loads_json(zlib.decompress(raw[len(SNAPSHOT_MAGIC):]))
+    if os.path.exists(LEGACY_MEALS_SNAPSHOT_FILE):
+        with open(LEGACY_MEALS_SNAPSHOT_FILE, 'rb') as f:
+            return loads_json(f.read())
+    return None
+
 # Read API key from key.properties file
 def get_api_key():
     try:
@@ -30,7 +258,309 @@ if api_key:
     genai.configure(api_key=api_key)
 else:
     print("Error: Could not load API key from key.properties")
-model = genai.GenerativeModel('gemini-1.5-flash')
+
+class ReplayResponse:
+    """Minimal stand-in for a Gemini response replayed from the recording store"""
+    def __init__(self, text):
+        self.text = text
+
+class ReplayModel:
+    """Wraps the Gemini model to record prompts and responses to, or replay them from, a JSONL store.
+    
+    Replays are matched on a hash of the whitespace-normalized prompt. When the same prompt
+    was recorded several times, the recordings are returned in their original order.
+    """
+    def __init__(self, model, mode, store_path, speed=1.0):
+        self.model = model
+        self.mode = mode
+        self.store_path = store_path
+        self.speed = speed
+        self.recordings = {}
+        self.replay_counts = {}
+        self.lock = threading.Lock()
+        if mode == 'replay':
+            for entry in load_recordings(store_path):
+                self.recordings.setdefault(entry['key'], []).append(entry)
+            print(f"Loaded {sum(len(entries) for entries in self.recordings.values())} Gemini recordings from {store_path}")
+
+    def generate_content(self, prompt):
+        key = prompt_key(prompt)
+        if self.mode == 'replay':
+            return self.replay(key)
+        
+        started = time.time()
+        entry = {'key': key, 'prompt': prompt, 'model': GEMINI_MODEL_NAME, 'recorded_at': started}
+        try:
+            response = self.model.generate_content(prompt)
+            entry['text'] = response.text
+            return response
+        except Exception as e:
+            entry['error'] = str(e)
+            raise
+        finally:
+            entry['latency'] = time.time() - started
+            with self.lock:
+                with open(self.store_path, 'ab') as f:
+                    f.write(dumps_json(entry) + b'\n')
+
+    def replay(self, key):
+        with self.lock:
+            entries = self.recordings.get(key)
+            if not entries:
+                raise LookupError(f"No recorded Gemini response for prompt {key[:12]}")
+            count = self.replay_counts.get(key, 0)
+            self.replay_counts[key] = count + 1
+            entry = entries[count % len(entries)]
+        
+        if self.speed > 0:
+            time.sleep(entry.get('latency', 0) * self.speed)
+        if 'error' in entry:
+            raise RuntimeError(entry['error'])
+        return ReplayResponse(entry['text'])
+
+def prompt_key(prompt):
+    """Stable hash of a prompt, ignoring indentation and other whitespace differences"""
+    return hashlib.sha256(' '.join(prompt.split()).encode('utf-8')).hexdigest()
+
+def load_recordings(store_path):
+    """Load recorded Gemini calls from a JSONL store"""
+    recordings = []
+    if os.path.exists(store_path):
+        with open(store_path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    recordings.append(loads_json(line))
+    return recordings
+
+model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+if GEMINI_REPLAY_MODE in ('record', 'replay'):
+    print(f"Gemini {GEMINI_REPLAY_MODE} mode using {GEMINI_REPLAY_STORE}")
+    model = ReplayModel(model, GEMINI_REPLAY_MODE, GEMINI_REPLAY_STORE, GEMINI_REPLAY_SPEED)
+
+# Worker pool for concurrent per-meal Gemini requests
+meal_executor = ThreadPoolExecutor(max_workers=8)
+
+# Dedicated pool for deadline-bound Gemini calls, so abandoned calls can't starve meal_executor
+gemini_executor = ThreadPoolExecutor(max_workers=16)
+
+# Moving average of observed Gemini latency, used to decide whether a call fits the deadline
+gemini_latency = {'estimate': GEMINI_LATENCY_ESTIMATE_SECONDS}
+
+# Circuit breaker: Gemini failures in a row, and the time until which Gemini is skipped once
+# they reach GEMINI_FAILURE_THRESHOLD
+gemini_breaker = {'failures': 0, 'open_until': 0.0}
+gemini_breaker_lock = threading.Lock()
+
+class Deadline:
+    """Time budget for one request, shared by every stage that handles it"""
+    def __init__(self, seconds):
+        self.expires_at = time.time() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows(self, estimated_seconds):
+        return self.remaining() >= estimated_seconds
+
+def request_deadline():
+    """Build the deadline for the current request from the X-Request-Deadline-Ms header or config"""
+    seconds = DEFAULT_REQUEST_DEADLINE_SECONDS
+    header = request.headers.get('X-Request-Deadline-Ms')
+    if header:
+        try:
+            client_seconds = float(header) / 1000
+            if not math.isfinite(client_seconds):
+                raise ValueError("not a finite number")
+            # Clients can only shorten the budget, never extend it
+            seconds = min(max(0.0, client_seconds), DEFAULT_REQUEST_DEADLINE_SECONDS)
+        except ValueError:
+            print(f"Ignoring invalid X-Request-Deadline-Ms header: {header}")
+    return Deadline(seconds)
+
+def record_gemini_latency(seconds):
+    """Fold one observed Gemini latency into the moving estimate"""
+    gemini_latency['estimate'] = 0.8 * gemini_latency['estimate'] + 0.2 * seconds
+
+def gemini_breaker_open():
+    """Whether Gemini is currently being skipped after repeated failures"""
+    return time.time() < gemini_breaker['open_until']
+
+def record_gemini_outcome(succeeded):
+    """Update the circuit breaker with the outcome of one Gemini call.
+    
+    The breaker opens after GEMINI_FAILURE_THRESHOLD failures in a row. Once the window has
+    passed, calls go through again: a success closes the breaker, another failure reopens it.
+    When replaying, the window is scaled by GEMINI_REPLAY_SPEED like the call latency, so an
+    instant replay follows the recorded outcomes instead of pausing on the wall clock.
+    """
+    with gemini_breaker_lock:
+        if succeeded:
+            gemini_breaker['failures'] = 0
+            return
+        gemini_breaker['failures'] += 1
+        if gemini_breaker['failures'] >= GEMINI_FAILURE_THRESHOLD:
+            window = GEMINI_FAILURE_BACKOFF_SECONDS
+            if GEMINI_REPLAY_MODE == 'replay':
+                window *= GEMINI_REPLAY_SPEED
+            gemini_breaker['open_until'] = time.time() + window
+            print(f"Gemini failed {gemini_breaker['failures']} times in a row, skipping it for {window:.0f}s")
+
+# Stage timings collected on a worker thread while it works for a request
+worker_stages = threading.local()
+
+@contextmanager
+def stage(name):
+    """Time one stage of the current request (or worker task) so it shows up in the profiling data"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            timings = g.setdefault('stage_timings', {})
+        else:
+            timings = getattr(worker_stages, 'timings', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+def record_worker_stages(timings):
+    """Add a worker task's stage timings to the current request under worker_ names"""
+    if timings and has_request_context():
+        request_timings = g.setdefault('stage_timings', {})
+        for name, seconds in timings.items():
+            request_timings[f"worker_{name}"] = request_timings.get(f"worker_{name}", 0.0) + seconds
+
+class StackSampler:
+    """Background thread that periodically samples the stacks of in-flight requests.
+    
+    Worker threads doing a request's Gemini call or parsing can be attached to that request,
+    so their samples are counted for it too, under a "worker" root frame.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start_request(self, thread_id):
+        with self.lock:
+            self.active[thread_id] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+                self.thread.start()
+
+    def finish_request(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, Counter())
+
+    def attach_worker(self, worker_id, owner_id):
+        with self.lock:
+            if owner_id in self.active:
+                self.workers[worker_id] = owner_id
+
+    def detach_worker(self, worker_id):
+        with self.lock:
+            self.workers.pop(worker_id, None)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                targets = {thread_id: thread_id for thread_id in self.active}
+                targets.update(self.workers)
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            for thread_id, owner_id in targets.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = collapse_stack(frame)
+                if thread_id != owner_id:
+                    stack = f"worker;{stack}"
+                with self.lock:
+                    samples = self.active.get(owner_id)
+                    if samples is not None:
+                        samples[stack] += 1
+
+def profiling_owner():
+    """Thread id of the current request for attaching workers to the sampler, or None"""
+    if PROFILING_ENABLED and has_request_context():
+        return threading.get_ident()
+    return None
+
+def collapse_stack(frame):
+    """Render a frame's stack root-first in the collapsed format used by flamegraph tools"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def collapsed_stacks(samples):
+    """Format stack sample counts as flamegraph-compatible collapsed text"""
+    return ''.join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+stack_sampler = StackSampler(PROFILE_SAMPLE_INTERVAL_SECONDS)
+# Recent requests with their stage timings, plus stack samples for the slow ones
+recent_requests = deque(maxlen=RECENT_REQUESTS_KEPT)
+recent_requests_lock = threading.Lock()
+request_ids = itertools.count(1)
+
+def run_gemini(prompt, deadline=None, owner=None):
+    """Make one Gemini call, timing it from when it actually starts.
+    
+    owner is the thread id of the request this call works for, so the stack sampler can
+    attribute this worker's samples to it.
+    """
+    if owner is not None:
+        stack_sampler.attach_worker(threading.get_ident(), owner)
+        try:
+            return run_gemini(prompt, deadline)
+        finally:
+            stack_sampler.detach_worker(threading.get_ident())
+    
+    if deadline is not None and deadline.expired():
+        # The request gave up while this call was queued, don't spend tokens on it
+        raise TimeoutError("Deadline passed before the Gemini call started")
+    if gemini_breaker_open():
+        raise RuntimeError(f"Skipping Gemini for {gemini_breaker['open_until'] - time.time():.0f}s after repeated failures")
+    
+    started = time.time()
+    try:
+        response = model.generate_content(prompt)
+        record_gemini_outcome(True)
+        return response
+    except LookupError:
+        # A replay miss, not an outage
+        raise
+    except Exception:
+        record_gemini_outcome(False)
+        raise
+    finally:
+        record_gemini_latency(time.time() - started)
+
+def call_gemini(prompt, deadline=None):
+    """Call Gemini and return the response text, giving up when the deadline runs out"""
+    if deadline is None:
+        return run_gemini(prompt).text.strip()
+    
+    if not deadline.allows(gemini_latency['estimate']):
+        raise TimeoutError(f"Only {deadline.remaining():.1f}s left, Gemini usually takes {gemini_latency['estimate']:.1f}s")
+    if gemini_breaker_open():
+        raise RuntimeError(f"Skipping Gemini for {gemini_breaker['open_until'] - time.time():.0f}s after repeated failures")
+    
+    started = time.time()
+    future = gemini_executor.submit(run_gemini, prompt, deadline, profiling_owner())
+    try:
+        return future.result(timeout=deadline.remaining()).text.strip()
+    except FuturesTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Gemini did not answer within the {time.time() - started:.1f}s left")
 
 def calculate_bmr(age, gender, height, weight):
     """Calculate Basal Metabolic Rate using Mifflin-St Jeor Equation"""
@@ -68,32 +598,343 @@ def calculate_macros(calories):
         'fiber': round(fiber_grams, 1)
     }
 
-def generate_all_meals_data(total_calories=2000):
-    """Generate comprehensive meals data using Gemini API and cache it"""
-    global meals_cache
+def normalize_dish_name(name):
+    """Normalize a dish name so spelling and punctuation variants compare equal"""
+    words = re.findall(r'[a-z0-9]+', str(name).lower())
+    words = [DISH_SYNONYMS.get(word, word) for word in words if word not in DISH_STOPWORDS]
+    return ' '.join(words)
+
+def dish_shingles(normalized_name):
+    """Character trigrams of a normalized dish name"""
+    padded = f" {normalized_name} "
+    return {padded[i:i + 3] for i in range(max(1, len(padded) - 2))}
+
+def jaccard(a, b):
+    """Jaccard similarity of two sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def same_dish_tokens(key, other):
+    """True when two normalized names have the same words, allowing for spelling variants"""
+    tokens = key.split()
+    other_tokens = other.split()
+    if len(tokens) != len(other_tokens):
+        return False
+    unmatched = [dish_shingles(token) for token in other_tokens]
+    for token in tokens:
+        shingles = dish_shingles(token)
+        scores = [jaccard(shingles, candidate) for candidate in unmatched]
+        if not scores or max(scores) < DISH_TOKEN_SIMILARITY_THRESHOLD:
+            return False
+        unmatched.pop(scores.index(max(scores)))
+    return True
+
+class DishIndex:
+    """MinHash/LSH index of dish names for de-duplication and "more like this" lookups.
+    
+    Each name's MinHash signature is banded twice: 16 bands of 4 rows tuned for the strict
+    duplicate check, and 32 bands of 2 rows that also catch loosely related names (about
+    0.4 trigram similarity) for similar(). A word index adds every dish that shares a word
+    with the query. Lookups rescore only these candidates exactly, so their cost grows with
+    the number of candidates rather than with the size of the index. Once max_dishes dishes
+    are indexed, the one Gemini returned least recently is evicted to make room.
+    """
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm=64, bands=16, similar_bands=32, threshold=DISH_SIMILARITY_THRESHOLD, max_dishes=5000):
+        rng = random.Random(2211)
+        self.perms = [(rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME)) for _ in range(num_perm)]
+        self.banding = {
+            'dedupe': (bands, num_perm // bands),
+            'similar': (similar_bands, num_perm // similar_bands)
+        }
+        self.threshold = threshold
+        self.max_dishes = max_dishes
+        self.dishes = {}
+        self.shingles = {}
+        self.buckets = {}
+        self.words = {}
+        self.catalog = {}
+        self.lock = threading.Lock()
+
+    def signature(self, shingles):
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+        return [min((a * h + b) % self.PRIME for h in hashes) for a, b in self.perms]
+
+    def band_keys(self, signature, banding):
+        bands, rows = self.banding[banding]
+        return [(banding, band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(bands)]
+
+    def candidates(self, key, signature, banding):
+        candidates = set()
+        for band_key in self.band_keys(signature, banding):
+            candidates |= self.buckets.get(band_key, set())
+        if banding == 'similar':
+            for word in key.split():
+                candidates |= self.words.get(word, set())
+        return candidates
+
+    def ranked_matches(self, key, shingles, banding):
+        """Return (score, key) pairs for candidate dishes, best first"""
+        signature = self.signature(shingles)
+        scored = [(1.0 if other == key else jaccard(shingles, self.shingles[other]), other)
+                  for other in self.candidates(key, signature, banding)]
+        return sorted(scored, reverse=True)
+
+    def add(self, item, meal_type=None):
+        """Index a dish and return the key of the dish it is a duplicate of (its own key if new)"""
+        key = normalize_dish_name(item['name'])
+        shingles = dish_shingles(key)
+        with self.lock:
+            canonical_key = None
+            for score, other in self.ranked_matches(key, shingles, 'dedupe'):
+                if score < self.threshold:
+                    break
+                if other == key or same_dish_tokens(key, other):
+                    canonical_key = other
+                    break
+            if canonical_key is None:
+                canonical_key = key
+                if len(self.dishes) >= self.max_dishes:
+                    self.evict(next(iter(self.dishes)))
+                self.dishes[key] = item
+                self.shingles[key] = shingles
+                signature = self.signature(shingles)
+                for banding in self.banding:
+                    for band_key in self.band_keys(signature, banding):
+                        self.buckets.setdefault(band_key, set()).add(key)
+                for word in key.split():
+                    self.words.setdefault(word, set()).add(key)
+            else:
+                # Keep dishes Gemini still returns at the recent end, so the oldest go first
+                self.dishes[canonical_key] = self.dishes.pop(canonical_key)
+            if meal_type is not None:
+                meal_catalog = self.catalog.setdefault(meal_type, {})
+                meal_catalog.pop(canonical_key, None)
+                meal_catalog[canonical_key] = True
+            return canonical_key
+
+    def evict(self, key):
+        """Drop a dish from every index. Call with self.lock held."""
+        del self.dishes[key]
+        signature = self.signature(self.shingles.pop(key))
+        for banding in self.banding:
+            for band_key in self.band_keys(signature, banding):
+                bucket = self.buckets[band_key]
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+        for word in key.split():
+            keys = self.words[word]
+            keys.discard(key)
+            if not keys:
+                del self.words[word]
+        for meal_catalog in self.catalog.values():
+            meal_catalog.pop(key, None)
+
+    def catalog_menu(self, meal_type, limit=5):
+        """Return the most recently generated dishes for a meal type"""
+        with self.lock:
+            keys = list(self.catalog.get(meal_type, {}))[-limit:]
+            return [self.dishes[key] for key in reversed(keys)]
+
+    def similar(self, name, limit=5):
+        """Return up to limit (item, score) pairs similar to name, excluding the dish itself"""
+        key = normalize_dish_name(name)
+        with self.lock:
+            matches = self.ranked_matches(key, dish_shingles(key), 'similar')
+            return [(self.dishes[other], round(score, 3)) for score, other in matches if other != key and score > 0][:limit]
+
+# Shared index of every dish Gemini has returned
+dish_index = DishIndex()
+
+def dedupe_menu_items(menu_items, meal_type=None):
+    """Drop dishes that duplicate an earlier dish in the same menu.
+    
+    Items keep their own names and nutrition; the dish index is only used to decide which
+    names refer to the same dish.
+    """
+    unique_items = []
+    seen = {}
+    for item in menu_items:
+        canonical_key = dish_index.add(item, meal_type)
+        if canonical_key in seen:
+            print(f"Dropped duplicate dish: {item['name']} (same as {seen[canonical_key]})")
+            continue
+        seen[canonical_key] = item['name']
+        unique_items.append(item)
+    return unique_items
+
+def build_meal_prompt(meal_type, calories):
+    """Build the Gemini prompt for a single meal type"""
+    return f"""
+        You are an expert in Andhra Pradesh cuisine. Generate exactly 5 authentic Andhra {meal_type} dishes with calories around {calories}.
+
+        Focus on traditional Andhra dishes with these characteristics:
+        - Use authentic Andhra spices (red chilies, tamarind, curry leaves, mustard seeds)
+        - Include only vegetarian options
+        - Traditional cooking methods and ingredients
+        - Regional specialties from different parts of Andhra Pradesh
+
+        Return ONLY a valid JSON array with this exact format:
+        [
+            {{"name": "Authentic Andhra Dish Name", "calories": 250, "protein": 15, "carbs": 30, "fiber": 5}},
+            {{"name": "Another Andhra Dish", "calories": 280, "protein": 20, "carbs": 25, "fiber": 4}},
+            {{"name": "Third Andhra Dish", "calories": 220, "protein": 12, "carbs": 35, "fiber": 6}},
+            {{"name": "Fourth Andhra Dish", "calories": 300, "protein": 18, "carbs": 40, "fiber": 3}},
+            {{"name": "Fifth Andhra Dish", "calories": 260, "protein": 14, "carbs": 32, "fiber": 5}}
+        ]
+
+        Do not include any text before or after the JSON array. Make sure all dish names are authentic Andhra cuisine.
+        """
+
+def parse_menu_items(response_text):
+    """Parse and validate a JSON array of menu items from a Gemini response"""
+    with stage('json_cleanup'):
+        # Clean the response text
+        response_text = response_text.replace('```json', '').replace('```', '').strip()
+        
+        # Find JSON array boundaries
+        start_idx = response_text.find('[')
+        end_idx = response_text.rfind(']') + 1
+        
+        if start_idx == -1 or end_idx == 0:
+            raise ValueError("No JSON array found in response")
+        
+        menu_items = json.loads(response_text[start_idx:end_idx])
     
-    # Check if we have cached data for the same calorie target
-    if (meals_cache['data'] is not None and 
-        meals_cache['total_calories'] == total_calories and 
-        meals_cache['timestamp'] is not None):
+    with stage('validation'):
+        # Validate the response structure
+        if not isinstance(menu_items, list) or len(menu_items) == 0:
+            raise ValueError("Empty or invalid menu list")
+        for item in menu_items:
+            if not isinstance(item, dict) or not all(key in item for key in ['name', 'calories', 'protein', 'carbs', 'fiber']):
+                raise ValueError("Invalid item structure")
+    
+    return menu_items
+
+def parse_all_menus(response_text):
+    """Parse and validate a JSON object with menus for every meal type from a Gemini response"""
+    with stage('json_cleanup'):
+        # Clean the response text
+        response_text = response_text.replace('```json', '').replace('```', '').strip()
+        
+        # Find JSON object boundaries
+        start_idx = response_text.find('{')
+        end_idx = response_text.rfind('}') + 1
         
-        # Check if cache is less than 1 hour old
-        if time.time() - meals_cache['timestamp'] < 3600:
-            print(f"Using cached meals data for {total_calories} calories")
-            return meals_cache['data']
+        if start_idx == -1 or end_idx == 0:
+            raise ValueError("No JSON object found in response")
+        
+        all_menus = json.loads(response_text[start_idx:end_idx])
     
-    print(f"Generating new meals data for {total_calories} calories using Gemini API...")
+    with stage('validation'):
+        # Validate the response structure
+        required_meals = ['breakfast', 'lunch', 'snack', 'dinner']
+        if not isinstance(all_menus, dict) or not all(meal in all_menus for meal in required_meals):
+            raise ValueError("Missing required meal types")
+        for meal_type in required_meals:
+            if not isinstance(all_menus[meal_type], list) or len(all_menus[meal_type]) == 0:
+                raise ValueError(f"Invalid {meal_type} structure")
+            for item in all_menus[meal_type]:
+                if not isinstance(item, dict) or not all(key in item for key in ['name', 'calories', 'protein', 'carbs', 'fiber']):
+                    raise ValueError(f"Invalid item structure in {meal_type}")
     
-    # Calculate calorie distribution
-    calorie_targets = {
-        'breakfast': int(total_calories * 0.25),
-        'lunch': int(total_calories * 0.35),
-        'snack': int(total_calories * 0.15),
-        'dinner': int(total_calories * 0.25)
-    }
+    return all_menus
+
+def request_meal_items(meal_type, calories, deadline=None, owner=None):
+    """Request and validate the menu for one meal type from Gemini.
+    
+    Returns (menu_items, stage_timings); the timings are only collected when the call works
+    for a profiled request (owner is set).
+    """
+    if owner is not None:
+        stack_sampler.attach_worker(threading.get_ident(), owner)
+        worker_stages.timings = {}
+    try:
+        with stage('gemini'):
+            response_text = run_gemini(build_meal_prompt(meal_type, calories), deadline).text.strip()
+        return parse_menu_items(response_text), getattr(worker_stages, 'timings', None)
+    finally:
+        if owner is not None:
+            stack_sampler.detach_worker(threading.get_ident())
+            worker_stages.timings = None
+
+def generate_all_meals_parallel(calorie_targets, deadline):
+    """Generate every meal type with its own concurrent Gemini request and assemble the results.
+    
+    Slow meal types get one hedged duplicate request after HEDGE_DELAY_SECONDS and the first
+    valid response wins. A failed meal type is retried on its own. Meal types that still fail,
+    or are not ready when the deadline runs out, are left out of the result.
+    """
+    if not deadline.allows(gemini_latency['estimate']):
+        raise TimeoutError(f"Only {deadline.remaining():.1f}s left, Gemini usually takes {gemini_latency['estimate']:.1f}s")
+    if gemini_breaker_open():
+        raise RuntimeError(f"Skipping Gemini for {gemini_breaker['open_until'] - time.time():.0f}s after repeated failures")
     
+    started = time.time()
+    owner = profiling_owner()
     all_menus = {}
+    given_up = set()
+    pending = {}
+    retries_left = {meal_type: PARALLEL_MEAL_RETRIES for meal_type in calorie_targets}
+    hedged = HEDGE_DELAY_SECONDS <= 0
+    
+    for meal_type, calories in calorie_targets.items():
+        pending[meal_executor.submit(request_meal_items, meal_type, calories, deadline, owner)] = meal_type
+    
+    while len(all_menus) + len(given_up) < len(calorie_targets):
+        timeout = deadline.remaining()
+        if not hedged:
+            timeout = min(timeout, max(0, started + HEDGE_DELAY_SECONDS - time.time()))
+        with stage('gemini'):
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        
+        if not done:
+            if deadline.expired():
+                print(f"Deadline reached with {sorted(set(pending.values()) - set(all_menus))} still pending")
+                break
+            # Hedge every meal type that is still outstanding
+            for meal_type in set(pending.values()) - set(all_menus):
+                print(f"Hedging slow {meal_type} request after {HEDGE_DELAY_SECONDS}s")
+                pending[meal_executor.submit(request_meal_items, meal_type, calorie_targets[meal_type], deadline, owner)] = meal_type
+            hedged = True
+            continue
+        
+        for future in done:
+            meal_type = pending.pop(future)
+            if meal_type in all_menus:
+                continue
+            try:
+                menu_items, timings = future.result()
+                record_worker_stages(timings)
+                with stage('dedupe'):
+                    all_menus[meal_type] = dedupe_menu_items(menu_items, meal_type)
+            except Exception as e:
+                print(f"{meal_type} generation failed: {e}")
+                if meal_type in pending.values():
+                    # A hedged duplicate is still in flight
+                    continue
+                if (retries_left[meal_type] > 0 and not gemini_breaker_open() and
+                        deadline.allows(gemini_latency['estimate'])):
+                    retries_left[meal_type] -= 1
+                    print(f"Retrying {meal_type} generation...")
+                    pending[meal_executor.submit(request_meal_items, meal_type, calorie_targets[meal_type], deadline, owner)] = meal_type
+                else:
+                    print(f"Giving up on {meal_type} generation")
+                    given_up.add(meal_type)
     
+    # Drop requests that have not started yet; ones already running finish in the background
+    # (and still cost tokens), their results are just ignored
+    for future in pending:
+        future.cancel()
+    
+    print(f"Parallel generation finished in {time.time() - started:.2f}s")
+    return {meal_type: all_menus[meal_type] for meal_type in calorie_targets if meal_type in all_menus}
+
+def generate_combined_meals(calorie_targets, deadline):
+    """Generate menus for every meal type with a single Gemini prompt"""
     # Generate comprehensive prompt for all meals at once
     prompt = f"""
     You are an expert in Andhra Pradesh cuisine. Generate a comprehensive menu for all meal types with the following calorie targets:
@@ -145,62 +986,87 @@ def generate_all_meals_data(total_calories=2000):
     Do not include any text before or after the JSON object. Make sure all dish names are authentic Andhra cuisine.
     """
     
+    with stage('gemini'):
+        response_text = call_gemini(prompt, deadline)
+    print(f"Gemini response length: {len(response_text)}")
+    
+    all_menus = parse_all_menus(response_text)
+    with stage('dedupe'):
+        for meal_type in calorie_targets:
+            all_menus[meal_type] = dedupe_menu_items(all_menus[meal_type], meal_type)
+    return all_menus
+
+def cached_meals_age(cache, total_calories):
+    """Age in seconds of the cached meals for this calorie target, or None if there are none"""
+    if (cache['data'] is not None and 
+        cache['total_calories'] == total_calories and 
+        cache['timestamp'] is not None):
+        return time.time() - cache['timestamp']
+    return None
+
+def generate_all_meals_data(total_calories=2000, mode=None, deadline=None):
+    """Generate comprehensive meals data using Gemini API and cache it.
+    
+    Works through the degradation tiers in MENU_SOURCE_TIERS: a fresh cache hit is returned
+    straight away, Gemini is only called if the deadline leaves room for it, and any meal
+    types it could not produce come from the stale cache, the dish catalog or the fallback
+    menus. Returns (menus, source), where source is the worst tier that was used.
+    """
+    if deadline is None:
+        deadline = Deadline(DEFAULT_REQUEST_DEADLINE_SECONDS)
+    
+    # Check if we have cached data for the same calorie target that is less than 1 hour old
+    # Read the cache once, set_meals_cache may replace it from another thread
+    cache = meals_cache
+    with stage('cache_lookup'):
+        cache_age = cached_meals_age(cache, total_calories)
+    if cache_age is not None and cache_age < FRESH_MEALS_MAX_AGE:
+        print(f"Using cached meals data for {total_calories} calories")
+        return cache['data'], 'fresh_cache'
+    stale_menus = cache['data'] if cache_age is not None and cache_age < STALE_MEALS_MAX_AGE else None
+    
+    # Calculate calorie distribution
+    calorie_targets = {
+        'breakfast': int(total_calories * 0.25),
+        'lunch': int(total_calories * 0.35),
+        'snack': int(total_calories * 0.15),
+        'dinner': int(total_calories * 0.25)
+    }
+    
+    print(f"Generating new meals data for {total_calories} calories using Gemini API ({deadline.remaining():.1f}s left)...")
+    
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        print(f"Gemini response length: {len(response_text)}")
-        
-        # Parse JSON response
-        try:
-            # Clean the response text
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            # Find JSON object boundaries
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                all_menus = json.loads(json_str)
-                
-                # Validate the response structure
-                required_meals = ['breakfast', 'lunch', 'snack', 'dinner']
-                if all(meal in all_menus for meal in required_meals):
-                    for meal_type in required_meals:
-                        if not isinstance(all_menus[meal_type], list) or len(all_menus[meal_type]) == 0:
-                            raise ValueError(f"Invalid {meal_type} structure")
-                        for item in all_menus[meal_type]:
-                            if not all(key in item for key in ['name', 'calories', 'protein', 'carbs', 'fiber']):
-                                raise ValueError(f"Invalid item structure in {meal_type}")
-                else:
-                    raise ValueError("Missing required meal types")
-                    
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"JSON parsing failed: {e}")
-            all_menus = None
-        
-        # Use fallback if AI response fails
-        if not all_menus:
-            print("Using fallback meals data...")
-            all_menus = get_fallback_meals_data(calorie_targets)
-        
-        # Cache the data
-        meals_cache['data'] = all_menus
-        meals_cache['timestamp'] = time.time()
-        meals_cache['total_calories'] = total_calories
-        
-        print(f"Successfully generated and cached meals data for {total_calories} calories")
-        return all_menus
-        
+        if (mode or MEALS_GENERATION_MODE) == 'parallel':
+            all_menus = generate_all_meals_parallel(calorie_targets, deadline)
+        else:
+            all_menus = generate_combined_meals(calorie_targets, deadline)
     except Exception as e:
         print(f"Error generating meals data: {e}")
-        # Return fallback data
-        fallback_data = get_fallback_meals_data(calorie_targets)
-        meals_cache['data'] = fallback_data
-        meals_cache['timestamp'] = time.time()
-        meals_cache['total_calories'] = total_calories
-        return fallback_data
+        all_menus = {}
+    
+    # Fill anything the AI tier could not produce from the cheaper tiers
+    source = 'ai'
+    with stage('degrade'):
+        fallback_menus = get_fallback_meals_data(calorie_targets)
+        for meal_type in calorie_targets:
+            if all_menus.get(meal_type):
+                continue
+            if stale_menus and stale_menus.get(meal_type):
+                all_menus[meal_type], tier = stale_menus[meal_type], 'stale_cache'
+            elif dish_index.catalog_menu(meal_type):
+                all_menus[meal_type], tier = dish_index.catalog_menu(meal_type), 'catalog'
+            else:
+                all_menus[meal_type], tier = fallback_menus[meal_type], 'fallback'
+            print(f"Using {tier} data for {meal_type}...")
+            source = max(source, tier, key=MENU_SOURCE_TIERS.index)
+    all_menus = {meal_type: all_menus[meal_type] for meal_type in calorie_targets}
+    
+    # Only complete AI answers are cached, so a degraded answer never replaces the stale cache
+    if source == 'ai':
+        set_meals_cache(all_menus, time.time(), total_calories)
+        print(f"Successfully generated and cached meals data for {total_calories} calories")
+    
+    return all_menus, source
 
 def get_fallback_meals_data(calorie_targets):
     """Get fallback meals data when AI fails"""
@@ -235,26 +1101,130 @@ def get_fallback_meals_data(calorie_targets):
         ]
     }
 
+@app.before_request
+def start_request_profiling():
+    """Start timing the request, and profiling it when asked to"""
+    g.request_started = time.time()
+    g.stage_timings = {}
+    if not PROFILING_ENABLED:
+        return
+    
+    stack_sampler.start_request(threading.get_ident())
+    profile_format = PROFILE_FORMATS.get(request.args.get('profile') or request.headers.get('X-Profile'))
+    if profile_format:
+        g.profile_format = profile_format
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError as e:
+            # Another profiler is already active in this interpreter
+            print(f"Could not start profiler: {e}")
+            g.profiler = None
+
+@app.after_request
+def finish_request_profiling(response):
+    """Record stage timings, keep stack samples of slow requests and return profile dumps"""
+    if not PROFILING_ENABLED:
+        return response
+    
+    duration = time.time() - g.request_started
+    samples = stack_sampler.finish_request(threading.get_ident())
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+    
+    stage_timings = {name: round(seconds * 1000, 2) for name, seconds in g.stage_timings.items()}
+    # Worker stages overlap the request thread's own stages, so they don't count towards other
+    request_thread_ms = sum(ms for name, ms in stage_timings.items() if not name.startswith('worker_'))
+    stage_timings['other'] = round(max(0.0, duration * 1000 - request_thread_ms), 2)
+    response.headers['Server-Timing'] = ', '.join(f"{name};dur={ms}" for name, ms in stage_timings.items())
+    
+    if not request.path.startswith(('/admin/', '/static/')):
+        record = {
+            'id': next(request_ids),
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'started': g.request_started,
+            'duration_ms': round(duration * 1000, 2),
+            'stage_timings_ms': stage_timings,
+            'samples': samples if duration >= SLOW_REQUEST_THRESHOLD_SECONDS else None
+        }
+        if record['samples'] is not None:
+            print(f"Slow request {record['id']} {request.path} took {duration:.2f}s, captured {sum(samples.values())} stack samples")
+        with recent_requests_lock:
+            recent_requests.append(record)
+    
+    if profiler is not None:
+        return profile_response(profiler, samples, g.profile_format)
+    return response
+
+@app.teardown_request
+def stop_request_sampling(error=None):
+    """Make sure a failed request does not stay registered with the stack sampler"""
+    if PROFILING_ENABLED:
+        stack_sampler.finish_request(threading.get_ident())
+
+def profile_response(profiler, samples, profile_format):
+    """Build the response for a profiled request: pstats text, raw pstats data or collapsed stacks"""
+    if profile_format == 'collapsed':
+        return app.response_class(collapsed_stacks(samples), mimetype='text/plain')
+    if profile_format == 'raw':
+        # Loadable with pstats.Stats or tools such as snakeviz
+        profiler.create_stats()
+        return app.response_class(marshal.dumps(profiler.stats), mimetype='application/octet-stream')
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(50)
+    return app.response_class(stream.getvalue(), mimetype='text/plain')
+
+@app.route('/admin/slow_requests', methods=['GET'])
+def slow_requests():
+    """List the slowest recent requests with their stage timings"""
+    if not PROFILING_ENABLED:
+        return jsonify({'success': False, 'error': 'Profiling is disabled'}), 403
+    
+    try:
+        limit = int(request.args.get('limit', 20))
+        with recent_requests_lock:
+            records = sorted(recent_requests, key=lambda record: record['duration_ms'], reverse=True)[:max(0, limit)]
+        
+        return jsonify({
+            'success': True,
+            'slow_threshold_ms': SLOW_REQUEST_THRESHOLD_SECONDS * 1000,
+            'requests': [
+                dict({key: value for key, value in record.items() if key != 'samples'}, has_samples=record['samples'] is not None)
+                for record in records
+            ]
+        })
+    except Exception as e:
+        print(f"Error in slow_requests: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/admin/slow_requests/<int:request_id>/stacks', methods=['GET'])
+def slow_request_stacks(request_id):
+    """Return the captured stack samples of a slow request as collapsed flamegraph input"""
+    if not PROFILING_ENABLED:
+        return jsonify({'success': False, 'error': 'Profiling is disabled'}), 403
+    
+    with recent_requests_lock:
+        record = next((record for record in recent_requests if record['id'] == request_id), None)
+    if record is None or record['samples'] is None:
+        return jsonify({'success': False, 'error': 'No stack samples for this request'}), 404
+    
+    return app.response_class(collapsed_stacks(record['samples']), mimetype='text/plain')
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/save_meals_data', methods=['POST'])
 def save_meals_data():
-    """Save current meals data to JSON file"""
+    """Save current meals data to the binary snapshot file"""
     try:
-        global meals_cache
-        
         if meals_cache['data'] is not None:
-            # Save to JSON file
-            with open('meals_data.json', 'w') as f:
-                json.dump({
-                    'data': meals_cache['data'],
-                    'timestamp': meals_cache['timestamp'],
-                    'total_calories': meals_cache['total_calories']
-                }, f, indent=2)
+            write_meals_snapshot()
             
-            print(f"Meals data saved to meals_data.json")
+            print(f"Meals data saved to {MEALS_SNAPSHOT_FILE}")
             return jsonify({
                 'success': True,
                 'message': 'Meals data saved successfully'
@@ -271,17 +1241,14 @@ def save_meals_data():
 
 @app.route('/load_meals_data', methods=['GET'])
 def load_meals_data():
-    """Load meals data from JSON file"""
+    """Load meals data from the snapshot file"""
     try:
-        global meals_cache
+        saved_data = read_meals_snapshot()
         
-        if os.path.exists('meals_data.json'):
-            with open('meals_data.json', 'r') as f:
-                saved_data = json.load(f)
-            
+        if saved_data is not None:
             # Check if saved data is less than 24 hours old
             if time.time() - saved_data['timestamp'] < 86400:  # 24 hours
-                meals_cache = saved_data
+                set_meals_cache(saved_data['data'], saved_data['timestamp'], saved_data['total_calories'])
                 print(f"Loaded meals data from file for {saved_data['total_calories']} calories")
                 return jsonify({
                     'success': True,
@@ -336,34 +1303,15 @@ def generate_menu():
         calories = data.get('calories', 300)
         cuisine_preference = data.get('cuisine', 'Andhra')
         
-        # Enhanced prompt specifically for Andhra cuisine
-        prompt = f"""
-        You are an expert in Andhra Pradesh cuisine. Generate exactly 5 authentic Andhra {meal_type} dishes with calories around {calories}.
-
-        Focus on traditional Andhra dishes with these characteristics:
-        - Use authentic Andhra spices (red chilies, tamarind, curry leaves, mustard seeds)
-        - Include only vegetarian options
-        - Traditional cooking methods and ingredients
-        - Regional specialties from different parts of Andhra Pradesh
-
-        Return ONLY a valid JSON array with this exact format:
-        [
-            {{"name": "Authentic Andhra Dish Name", "calories": 250, "protein": 15, "carbs": 30, "fiber": 5}},
-            {{"name": "Another Andhra Dish", "calories": 280, "protein": 20, "carbs": 25, "fiber": 4}},
-            {{"name": "Third Andhra Dish", "calories": 220, "protein": 12, "carbs": 35, "fiber": 6}},
-            {{"name": "Fourth Andhra Dish", "calories": 300, "protein": 18, "carbs": 40, "fiber": 3}},
-            {{"name": "Fifth Andhra Dish", "calories": 260, "protein": 14, "carbs": 32, "fiber": 5}}
-        ]
-
-        Do not include any text before or after the JSON array. Make sure all dish names are authentic Andhra cuisine.
-        """
-        
         print(f"Generating Andhra {meal_type} menu with {calories} calories...")
         
+        deadline = request_deadline()
+        source = 'ai'
+        
         # Generate content with Gemini AI
         try:
-            response = model.generate_content(prompt)
-            response_text = response.text.strip()
+            with stage('gemini'):
+                response_text = call_gemini(build_meal_prompt(meal_type, calories), deadline)
         except Exception as api_error:
             print(f"Gemini API error for menu generation: {api_error}")
             response_text = ""
@@ -371,33 +1319,22 @@ def generate_menu():
         print(f"Gemini response: {response_text[:200]}...")
         
         # Parse JSON response
-        menu_items = None
         try:
-            # Clean the response text
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            # Find JSON array boundaries
-            start_idx = response_text.find('[')
-            end_idx = response_text.rfind(']') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                menu_items = json.loads(json_str)
-                
-                # Validate the response structure
-                if isinstance(menu_items, list) and len(menu_items) > 0:
-                    for item in menu_items:
-                        if not all(key in item for key in ['name', 'calories', 'protein', 'carbs', 'fiber']):
-                            raise ValueError("Invalid item structure")
-                else:
-                    raise ValueError("Empty or invalid menu list")
-                    
+            menu_items = parse_menu_items(response_text)
+            with stage('dedupe'):
+                menu_items = dedupe_menu_items(menu_items, meal_type)
         except (json.JSONDecodeError, ValueError) as e:
             print(f"JSON parsing failed: {e}")
             menu_items = None
         
+        # Dishes generated earlier for this meal type
+        if not menu_items:
+            menu_items = dish_index.catalog_menu(meal_type)
+            source = 'catalog'
+        
         # Enhanced fallback menu with more authentic Andhra dishes
         if not menu_items:
+            source = 'fallback'
             print("Using enhanced Andhra fallback menu...")
             fallback_menus = {
                 'breakfast': [
@@ -434,7 +1371,7 @@ def generate_menu():
         return jsonify({
             'success': True,
             'menu_items': menu_items,
-            'source': 'ai' if menu_items and 'fallback' not in str(menu_items) else 'fallback'
+            'source': source
         })
         
     except Exception as e:
@@ -447,31 +1384,168 @@ def generate_all_menus():
     try:
         data = request.json
         total_calories = data.get('total_calories', 2000)
+        # Parallel mode costs more tokens, so clients only pick it when the server allows it
+        mode = data.get('mode') if ALLOW_CLIENT_GENERATION_MODE else None
         
         # Use the cached meals data function
-        all_menus = generate_all_meals_data(total_calories)
+        all_menus, source = generate_all_meals_data(total_calories, mode, request_deadline())
+        cached = source in ('fresh_cache', 'stale_cache')
+        
+        # Splice the pre-serialized menus into the response instead of re-encoding them
+        cache = meals_cache
+        encoded_menus = get_encoded_menus(cache) if all_menus is cache['data'] else dumps_json(all_menus)
+        body = (b'{"success":true,"cached":' + (b'true' if cached else b'false') +
+                b',"source":' + dumps_json(source) + b',"menus":' + encoded_menus + b'}\n')
+        return app.response_class(body, mimetype='application/json')
+        
+    except Exception as e:
+        print(f"Error in generate_all_menus: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/similar_dishes', methods=['POST'])
+def similar_dishes():
+    """Find previously generated dishes similar to the given dish name"""
+    try:
+        data = request.json
+        name = data['name']
+        limit = int(data.get('limit', 5))
+        
+        matches = dish_index.similar(name, limit)
         
         return jsonify({
             'success': True,
-            'menus': all_menus,
-            'cached': meals_cache['data'] is not None and meals_cache['total_calories'] == total_calories
+            'dishes': [dict(item, similarity=score) for item, score in matches]
         })
+    except Exception as e:
+        print(f"Error in similar_dishes: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/update_consumption', methods=['POST'])
+def update_consumption():
+    """Apply an item add/remove delta to a session's running nutrition totals.
+    
+    Clients number their updates with seq. An update that skips a number means an earlier
+    one was lost, so it is rejected with resync set and the client resends its totals.
+    Updates already covered by such a resync are ignored.
+    """
+    try:
+        data = request.json
+        session_id = str(data['session_id'])
+        seq = data.get('seq')
         
+        with consumption_lock:
+            session = consumption_sessions.get(session_id)
+            if session is None and not data.get('item') and not data.get('totals'):
+                session = start_consumption_session(session_id)
+            if data.get('reset'):
+                session = start_consumption_session(session_id, seq or 0)
+            elif data.get('totals'):
+                if session is None:
+                    session = start_consumption_session(session_id)
+                resync_consumption_totals(session, data['totals'])
+                if seq is not None:
+                    session['seq'] = seq
+            elif session is None or (seq is not None and seq > session['seq'] + 1):
+                return jsonify({
+                    'success': False,
+                    'resync': True,
+                    'error': 'Consumption updates are out of sync, resend the totals'
+                })
+            elif seq is not None and seq <= session['seq']:
+                print(f"Ignoring consumption update {seq}, already covered by update {session['seq']}")
+            else:
+                if data.get('item'):
+                    apply_consumption_delta(session, data.get('op', 'add'), data['item'])
+                session['seq'] = seq if seq is not None else session['seq'] + 1
+            if data.get('requirements'):
+                session['requirements'] = {key: float(data['requirements'][key]) for key in NUTRIENT_KEYS}
+            session['updated'] = time.time()
+            
+            totals = {key: round(value, 1) for key, value in session['totals'].items()}
+            diffs = consumption_diffs(session) if session['requirements'] else None
+            seq = session['seq']
+        
+        return jsonify({
+            'success': True,
+            'seq': seq,
+            'totals': totals,
+            'diffs': diffs
+        })
     except Exception as e:
-        print(f"Error in generate_all_menus: {e}")
+        print(f"Error in update_consumption: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/get_suggestions', methods=['POST'])
 def get_suggestions():
     try:
         data = request.json
-        calorie_diff = data['calorie_diff']
-        protein_diff = data['protein_diff']
-        carb_diff = data['carb_diff']
-        fiber_diff = data['fiber_diff']
         
-        # Enhanced prompt for better suggestions
-        prompt = f"""
+        # Sessions are the source of truth: their running totals are used as long as the
+        # server has seen every update the client sent (seq matches)
+        diffs = None
+        session_id = data.get('session_id')
+        if session_id is not None:
+            with stage('session_lookup'), consumption_lock:
+                session = consumption_sessions.get(str(session_id))
+                if session is not None and session['requirements'] and data.get('seq', session['seq']) == session['seq']:
+                    diffs = consumption_diffs(session)
+            if diffs is None:
+                return jsonify({
+                    'success': False,
+                    'resync': True,
+                    'error': 'Consumption totals are out of sync, resend them to /update_consumption'
+                })
+        elif all(key in data for key in SUGGESTION_BANDS):
+            # Clients without a session send their own diffs
+            diffs = {key: data[key] for key in SUGGESTION_BANDS}
+        else:
+            raise ValueError("Send nutrition diffs or a session_id with requirements")
+        
+        # Reuse advice while every nutrition gap stays inside the same band
+        band_key = suggestion_band_key(diffs)
+        with stage('cache_lookup'), consumption_lock:
+            cached_suggestions = suggestions_cache.get(band_key)
+        if cached_suggestions:
+            print(f"Using cached suggestions for bands {band_key}")
+            return jsonify({
+                'success': True,
+                'suggestions': cached_suggestions,
+                'cached': True,
+                'source': 'cache'
+            })
+        
+        suggestions, source = generate_suggestions(deadline=request_deadline(), **diffs)
+        if source == 'ai':
+            with consumption_lock:
+                if len(suggestions_cache) >= MAX_CACHED_SUGGESTIONS:
+                    suggestions_cache.clear()
+                suggestions_cache[band_key] = suggestions
+        
+        return jsonify({
+            'success': True,
+            'suggestions': suggestions,
+            'cached': False,
+            'source': source
+        })
+    except Exception as e:
+        print(f"Error in get_suggestions: {e}")
+        # Return fallback suggestions
+        suggestions = generate_fallback_suggestions(
+            data.get('calorie_diff', 0),
+            data.get('protein_diff', 0),
+            data.get('carb_diff', 0),
+            data.get('fiber_diff', 0)
+        )
+        return jsonify({
+            'success': True,
+            'suggestions': suggestions,
+            'source': 'fallback'
+        })
+
+def generate_suggestions(calorie_diff, protein_diff, carb_diff, fiber_diff, deadline=None):
+    """Ask Gemini for nutrition suggestions, returning (suggestions, source)"""
+    # Enhanced prompt for better suggestions
+    prompt = f"""
         You are a nutrition expert specializing in Andhra cuisine. Based on the nutrition analysis below, provide exactly 3 personalized recommendations.
 
         Current Nutrition Status:
@@ -493,38 +1567,21 @@ def get_suggestions():
 
         Format your response as exactly 3 bullet points, each starting with "•"
         """
-        
-        print(f"Getting suggestions for: Cal={calorie_diff}, Pro={protein_diff}, Carb={carb_diff}, Fib={fiber_diff}")
-        
-        try:
-            response = model.generate_content(prompt)
-            suggestions = response.text.strip()
-        except Exception as api_error:
-            print(f"Gemini API error: {api_error}")
-            # Return fallback suggestions if API fails
-            suggestions = generate_fallback_suggestions(calorie_diff, protein_diff, carb_diff, fiber_diff)
-        
-        # Fallback suggestions if AI fails
-        if not suggestions or len(suggestions) < 50:
-            suggestions = generate_fallback_suggestions(calorie_diff, protein_diff, carb_diff, fiber_diff)
-        
-        return jsonify({
-            'success': True,
-            'suggestions': suggestions
-        })
-    except Exception as e:
-        print(f"Error in get_suggestions: {e}")
-        # Return fallback suggestions
-        suggestions = generate_fallback_suggestions(
-            data.get('calorie_diff', 0),
-            data.get('protein_diff', 0),
-            data.get('carb_diff', 0),
-            data.get('fiber_diff', 0)
-        )
-        return jsonify({
-            'success': True,
-            'suggestions': suggestions
-        })
+    
+    print(f"Getting suggestions for: Cal={calorie_diff}, Pro={protein_diff}, Carb={carb_diff}, Fib={fiber_diff}")
+    
+    try:
+        with stage('gemini'):
+            suggestions = call_gemini(prompt, deadline)
+    except Exception as api_error:
+        print(f"Gemini API error: {api_error}")
+        suggestions = None
+    
+    # Fallback suggestions if AI fails
+    if not suggestions or len(suggestions) < 50:
+        return generate_fallback_suggestions(calorie_diff, protein_diff, carb_diff, fiber_diff), 'fallback'
+    
+    return suggestions, 'ai'
 
 def generate_fallback_suggestions(calorie_diff, protein_diff, carb_diff, fiber_diff):
     """Generate fallback suggestions when AI is unavailable"""
@@ -562,13 +1619,12 @@ def generate_fallback_suggestions(calorie_diff, protein_diff, carb_diff, fiber_d
 if __name__ == '__main__':
     # Try to load cached meals data on startup
     try:
-        if os.path.exists('meals_data.json'):
-            with open('meals_data.json', 'r') as f:
-                saved_data = json.load(f)
-            
+        saved_data = read_meals_snapshot()
+        
+        if saved_data is not None:
             # Check if saved data is less than 24 hours old
             if time.time() - saved_data['timestamp'] < 86400:  # 24 hours
-                meals_cache = saved_data
+                set_meals_cache(saved_data['data'], saved_data['timestamp'], saved_data['total_calories'])
                 print(f"✅ Loaded cached meals data for {saved_data['total_calories']} calories")
             else:
                 print("⏰ Cached meals data is too old, will generate new data when needed")
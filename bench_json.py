@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for JSON encode/decode cost per request and per snapshot
+"""
+
+import json
+import time
+import zlib
+
+import app
+
+ITERATIONS = 2000
+
+def timeit(label, func, iterations=ITERATIONS):
+    """Run func repeatedly and print the average cost per call in microseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"   {label:<45} {elapsed / iterations * 1e6:9.1f} µs")
+    return elapsed / iterations
+
+def bench_response_encoding(menus):
+    """Compare ways of building the /generate_all_menus response body"""
+    print("\n🧪 /generate_all_menus response encoding (per request)")
+
+    payload = {'success': True, 'cached': True, 'menus': menus}
+    encoded_menus = app.dumps_json(menus)
+
+    timeit("json.dumps (stdlib)", lambda: json.dumps(payload))
+    timeit("dumps_json (fast encoder)", lambda: app.dumps_json(payload))
+    timeit("pre-serialized bytes splice", lambda: (
+        b'{"success":true,"cached":true,"menus":' + encoded_menus + b'}\n'))
+
+    with app.app.app_context():
+        timeit("app.json.dumps (Flask provider)", lambda: app.app.json.dumps(payload))
+
+def bench_decoding(menus):
+    """Compare JSON decode cost for a full menus payload"""
+    print("\n🧪 Menus decoding (per request)")
+
+    text = json.dumps(menus)
+    data = text.encode('utf-8')
+
+    timeit("json.loads (stdlib)", lambda: json.loads(text))
+    timeit("loads_json (fast decoder)", lambda: app.loads_json(data))
+
+def bench_snapshots(menus):
+    """Compare the legacy indented JSON snapshot with the binary snapshot"""
+    print("\n🧪 Snapshot encode/decode")
+
+    snapshot = {'data': menus, 'timestamp': time.time(), 'total_calories': 2000}
+    legacy = json.dumps(snapshot, indent=2)
+    binary = app.SNAPSHOT_MAGIC + zlib.compress(app.dumps_json(snapshot), 6)
+
+    print(f"   legacy JSON size: {len(legacy.encode('utf-8'))} bytes, binary size: {len(binary)} bytes")
+    timeit("legacy encode (json.dumps indent=2)", lambda: json.dumps(snapshot, indent=2), 500)
+    timeit("binary encode (dumps_json + zlib)", lambda: (
+        app.SNAPSHOT_MAGIC + zlib.compress(app.dumps_json(snapshot), 6)), 500)
+    timeit("legacy decode (json.loads)", lambda: json.loads(legacy), 500)
+    timeit("binary decode (zlib + loads_json)", lambda: app.loads_json(
+        zlib.decompress(binary[len(app.SNAPSHOT_MAGIC):])), 500)
+
+if __name__ == '__main__':
+    print("⏱️ Eat Mindfully JSON Benchmarks")
+    print("=" * 50)
+    print(f"Fast encoder: {'orjson' if app.orjson is not None else 'stdlib json (orjson not installed)'}")
+
+    calorie_targets = {'breakfast': 500, 'lunch': 700, 'snack': 300, 'dinner': 500}
+    menus = app.get_fallback_meals_data(calorie_targets)
+
+    bench_response_encoding(menus)
+    bench_decoding(menus)
+    bench_snapshots(menus)
+
+    print("\n🎉 Benchmarks completed!")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Offline replay harness for recorded Gemini responses
+
+Record traffic first by running the app with GEMINI_REPLAY_MODE=record, then run:
+    python replay_harness.py [--store gemini_recordings.jsonl] [--speed 0]
+"""
+
+import argparse
+import os
+import time
+
+def percentile(values, pct):
+    """Return the pct-th percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def classify(prompt):
+    """Work out which parser a recorded prompt belongs to"""
+    if 'JSON array' in prompt:
+        return 'meal'
+    if 'JSON object' in prompt:
+        return 'all_meals'
+    return 'suggestions'
+
+def replay_parsing(app, recordings):
+    """Run every recorded response through the app's parsers and count fallbacks"""
+    print("\n🧪 Parsing recorded responses...")
+
+    stats = {}
+    for entry in recordings:
+        kind = classify(entry['prompt'])
+        kind_stats = stats.setdefault(kind, {'total': 0, 'fallback': 0, 'times': []})
+        kind_stats['total'] += 1
+
+        if 'error' in entry:
+            kind_stats['fallback'] += 1
+            continue
+
+        started = time.perf_counter()
+        try:
+            if kind == 'meal':
+                app.parse_menu_items(entry['text'])
+            elif kind == 'all_meals':
+                app.parse_all_menus(entry['text'])
+            elif len(entry['text'].strip()) < 50:
+                raise ValueError("Suggestions too short")
+        except ValueError:
+            kind_stats['fallback'] += 1
+        kind_stats['times'].append(time.perf_counter() - started)
+
+    for kind, kind_stats in stats.items():
+        print(f"   {kind:<12} {kind_stats['total']:4d} responses, "
+              f"{kind_stats['fallback']:4d} would fall back, "
+              f"parse p50 {percentile(kind_stats['times'], 50) * 1e6:.0f} µs, "
+              f"p99 {percentile(kind_stats['times'], 99) * 1e6:.0f} µs")
+
+def replay_traffic(app, recordings):
+    """Replay recorded calls in their original order and spacing through the replay model"""
+    print(f"\n🧪 Replaying {len(recordings)} calls (speed x{app.GEMINI_REPLAY_SPEED})...")
+
+    latencies = []
+    errors = 0
+    first_recorded = recordings[0].get('recorded_at', 0)
+    replay_started = time.time()
+
+    for entry in recordings:
+        # Keep the original gaps between calls, scaled like the call latency
+        offset = (entry.get('recorded_at', first_recorded) - first_recorded) * app.GEMINI_REPLAY_SPEED
+        delay = replay_started + offset - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        started = time.perf_counter()
+        try:
+            app.model.generate_content(entry['prompt'])
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    print(f"   {errors} errors, latency p50 {percentile(latencies, 50):.3f}s, "
+          f"p99 {percentile(latencies, 99):.3f}s, total {time.time() - replay_started:.2f}s")
+
+def replay_caching(app):
+    """Exercise /generate_all_menus cold and warm against the replayed model"""
+    print("\n🧪 Cache behaviour for /generate_all_menus...")
+
+    client = app.app.test_client()
+    for attempt in ('cold', 'warm'):
+        started = time.perf_counter()
+        result = client.post('/generate_all_menus', json={'total_calories': 2000}).get_json()
+        elapsed = time.perf_counter() - started
+        print(f"   {attempt}: {elapsed * 1000:.1f} ms, success={result.get('success')}, "
+              f"cached={result.get('cached')}, source={result.get('source')}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded Gemini traffic offline')
+    parser.add_argument('--store', default='gemini_recordings.jsonl', help='Recording store to replay')
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help='Latency multiplier: 1 keeps recorded timing, 0 replays instantly')
+    args = parser.parse_args()
+
+    # The app reads its replay settings at import time
+    os.environ['GEMINI_REPLAY_MODE'] = 'replay'
+    os.environ['GEMINI_REPLAY_STORE'] = args.store
+    os.environ['GEMINI_REPLAY_SPEED'] = str(args.speed)
+    import app
+
+    print("🔁 Eat Mindfully Replay Harness")
+    print("=" * 50)
+
+    recordings = app.load_recordings(args.store)
+    if not recordings:
+        print(f"❌ No recordings found in {args.store}. Run the app with GEMINI_REPLAY_MODE=record first.")
+        exit(1)
+
+    recordings.sort(key=lambda entry: entry.get('recorded_at', 0))
+
+    replay_parsing(app, recordings)
+    replay_traffic(app, recordings)
+    replay_caching(app)
+
+    print("\n🎉 Replay completed!")
@@ -25,7 +25,7 @@ def test_gemini_connection():
         print(f"✅ API key loaded: {api_key[:10]}...")
         
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        model = genai.GenerativeModel('gemini-1.5-flash')  # keep in sync with GEMINI_MODEL_NAME in app.py
         
         # Test with a simple prompt
         response = model.generate_content("Say 'Hello, Eat Mindfully!' in one word.")
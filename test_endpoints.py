@@ -5,6 +5,7 @@ Test script to verify API endpoints work correctly
 
 import requests
 import json
+import time
 
 def test_calorie_calculation():
     """Test calorie calculation endpoint"""
@@ -90,6 +91,191 @@ def test_all_menus_generation():
         print(f"❌ Error testing all menus generation: {e}")
         return False
 
+def test_parallel_menus_generation():
+    """Test all menus generation in parallel mode (start the app with ALLOW_CLIENT_GENERATION_MODE=1)"""
+    print("\n🧪 Testing parallel all menus generation...")
+    
+    data = {
+        "total_calories": 2150,
+        "mode": "parallel"
+    }
+    meal_types = ["breakfast", "lunch", "snack", "dinner"]
+    
+    try:
+        response = requests.post('http://localhost:5001/generate_all_menus', json=data)
+        result = response.json()
+        
+        if not result.get('success'):
+            print(f"❌ Parallel menus generation failed: {result.get('error')}")
+            return False
+        if sorted(result.get('menus', {})) != sorted(meal_types):
+            print(f"❌ Parallel menus came back with meal types {sorted(result.get('menus', {}))}")
+            return False
+        if not all(result['menus'][meal_type] for meal_type in meal_types):
+            print(f"❌ Parallel menus have an empty meal type")
+            return False
+        if result.get('source') not in ('fresh_cache', 'ai', 'stale_cache', 'catalog', 'fallback'):
+            print(f"❌ Parallel menus have an unknown source: {result.get('source')}")
+            return False
+        
+        print(f"✅ Parallel menus generation successful!")
+        print(f"   Source: {result['source']}")
+        if result['source'] == 'fresh_cache':
+            print("⚠️ Served from cache, restart the app to exercise the parallel requests again")
+        for meal_type in meal_types:
+            print(f"   {meal_type.title()}: {len(result['menus'][meal_type])} items")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Error testing parallel menus generation: {e}")
+        return False
+
+def test_similar_dishes():
+    """Test similar dishes endpoint"""
+    print("\n🧪 Testing similar dishes lookup...")
+    
+    data = {
+        "name": "Pesarattu",
+        "limit": 5
+    }
+    
+    try:
+        response = requests.post('http://localhost:5001/similar_dishes', json=data)
+        result = response.json()
+        
+        if result.get('success'):
+            print(f"✅ Similar dishes lookup successful!")
+            print(f"   Found {len(result['dishes'])} dishes similar to {data['name']}")
+            for dish in result['dishes'][:3]:
+                print(f"   - {dish['name']} (similarity {dish['similarity']})")
+            return True
+        else:
+            print(f"❌ Similar dishes lookup failed: {result.get('error')}")
+            return False
+            
+    except Exception as e:
+        print(f"❌ Error testing similar dishes: {e}")
+        return False
+
+def test_consumption_tracking():
+    """Test numbered consumption updates (add, remove, resync after a lost update, reset) and session-based suggestions"""
+    print("\n🧪 Testing consumption tracking...")
+    
+    session_id = f"test-{int(time.time())}"
+    requirements = {"calories": 2000, "protein": 100, "carbs": 200, "fiber": 28}
+    item = {"name": "Pesarattu with Allam Chutney", "calories": 280, "protein": 12, "carbs": 35, "fiber": 6}
+    zero = {"calories": 0, "protein": 0, "carbs": 0, "fiber": 0}
+    double = {key: item[key] * 2 for key in zero}
+    
+    # (label, update, expected totals, or None when the server should ask for a resync)
+    steps = [
+        ("set requirements", {"seq": 1, "requirements": requirements}, zero),
+        ("add item", {"seq": 2, "op": "add", "item": item}, item),
+        ("add item again", {"seq": 3, "op": "add", "item": item}, double),
+        ("remove item", {"seq": 4, "op": "remove", "item": item}, item),
+        ("update after a lost one", {"seq": 6, "op": "add", "item": item}, None),
+        ("resync", {"seq": 6, "totals": double}, double),
+        ("update covered by the resync", {"seq": 6, "op": "add", "item": item}, double),
+        ("reset", {"seq": 7, "reset": True, "requirements": requirements}, zero)
+    ]
+    
+    try:
+        for label, update, expected in steps:
+            data = dict(update, session_id=session_id)
+            response = requests.post('http://localhost:5001/update_consumption', json=data)
+            result = response.json()
+            
+            if expected is None:
+                if not result.get('resync'):
+                    print(f"❌ Consumption {label} was not rejected for a resync: {result}")
+                    return False
+                print(f"   {label}: resync requested")
+                continue
+            if not result.get('success'):
+                print(f"❌ Consumption {label} failed: {result.get('error')}")
+                return False
+            if any(abs(result['totals'][key] - expected[key]) > 0.01 for key in zero):
+                print(f"❌ Consumption {label} gave totals {result['totals']}, expected {expected}")
+                return False
+            print(f"   {label}: {result['totals']['calories']} cal")
+        
+        stale = requests.post('http://localhost:5001/get_suggestions', json={"session_id": session_id, "seq": 8}).json()
+        if not stale.get('resync'):
+            print(f"❌ Suggestions for an out-of-date session were not rejected for a resync")
+            return False
+        current = requests.post('http://localhost:5001/get_suggestions', json={"session_id": session_id, "seq": 7}).json()
+        if not current.get('success'):
+            print(f"❌ Suggestions from the session totals failed: {current.get('error')}")
+            return False
+        print(f"   session suggestions source: {current.get('source')}")
+        
+        print(f"✅ Consumption tracking successful!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Error testing consumption tracking: {e}")
+        return False
+
+def test_suggestions_band_cache():
+    """Test that suggestions are reused while nutrition gaps stay in the same band"""
+    print("\n🧪 Testing suggestions band cache...")
+    
+    # Both sets of diffs fall in the same 100 kcal / 10 g / 20 g / 5 g bands
+    first = {"calorie_diff": 1510, "protein_diff": 81, "carb_diff": 161, "fiber_diff": 21}
+    second = {"calorie_diff": 1590, "protein_diff": 89, "carb_diff": 179, "fiber_diff": 24}
+    
+    try:
+        first_result = requests.post('http://localhost:5001/get_suggestions', json=first).json()
+        second_result = requests.post('http://localhost:5001/get_suggestions', json=second).json()
+        
+        if not first_result.get('success') or not second_result.get('success'):
+            print(f"❌ Suggestions failed: {first_result.get('error') or second_result.get('error')}")
+            return False
+        
+        print(f"   First call source: {first_result.get('source')}, second call source: {second_result.get('source')}")
+        if first_result.get('source') == 'fallback':
+            print("⚠️ First call used fallback suggestions, which are never cached - check the API key")
+            return False
+        if second_result.get('cached'):
+            print(f"✅ Suggestions band cache hit!")
+            return True
+        print(f"❌ Second call in the same bands was not served from cache")
+        return False
+        
+    except Exception as e:
+        print(f"❌ Error testing suggestions band cache: {e}")
+        return False
+
+def test_slow_requests():
+    """Test slow requests admin endpoint"""
+    print("\n🧪 Testing slow requests admin endpoint...")
+    
+    try:
+        response = requests.get('http://localhost:5001/admin/slow_requests', params={"limit": 5})
+        result = response.json()
+        
+        if response.status_code == 403:
+            print("⚠️ Profiling is disabled - start the app with PROFILING_ENABLED=1 to test this endpoint")
+            return True
+        if not result.get('success'):
+            print(f"❌ Slow requests listing failed: {result.get('error')}")
+            return False
+        
+        print(f"✅ Slow requests listing successful!")
+        for record in result['requests'][:3]:
+            print(f"   - {record['method']} {record['path']}: {record['duration_ms']} ms {record['stage_timings_ms']}")
+        
+        # A bad limit must give a JSON error rather than a server error
+        response = requests.get('http://localhost:5001/admin/slow_requests', params={"limit": "abc"})
+        if response.status_code != 200 or response.json().get('success'):
+            print(f"❌ Invalid limit was not rejected cleanly (status {response.status_code})")
+            return False
+        return True
+        
+    except Exception as e:
+        print(f"❌ Error testing slow requests: {e}")
+        return False
+
 if __name__ == '__main__':
     print("🧪 Testing Eat Mindfully API Endpoints")
     print("=" * 50)
@@ -110,6 +296,11 @@ if __name__ == '__main__':
     tdee = test_calorie_calculation()
     test_menu_generation()
     test_all_menus_generation()
+    test_parallel_menus_generation()
+    test_similar_dishes()
+    test_consumption_tracking()
+    test_suggestions_band_cache()
+    test_slow_requests()
     
     print("\n🎉 API endpoint tests completed!")
     print("📱 You can now open http://localhost:5001 in your browser")